@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# Feed artwork thumbnail cache for the HTML index
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import aiohttp
+from tqdm.asyncio import tqdm_asyncio
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CACHE_DIR = Path.home() / '.cache' / 'powercasts' / 'artwork'
+THUMBNAIL_SIZE = (64, 64)
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+
+
+def parse_opml_artwork(file_path):
+    """returns dict of feed name -> imageUrl from an OPML file"""
+    text_pattern = re.compile(r'text="([^"]+)"')
+    image_pattern = re.compile(r'imageUrl="([^"]+)"')
+    artwork = {}
+    with open(file_path, 'r') as f:
+        for line in f:
+            if 'imageUrl=' in line:
+                name_match = text_pattern.search(line)
+                image_match = image_pattern.search(line)
+                if name_match and image_match:
+                    artwork[name_match.group(1)] = image_match.group(1)
+    return artwork
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """returns JPEG bytes of data scaled down to fit size"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail(size)
+        out = io.BytesIO()
+        image.convert('RGB').save(out, 'JPEG', quality=80, optimize=True)
+    return out.getvalue()
+
+
+class ArtworkCache:
+    """content-addressed thumbnails, <sha256>.jpg, plus index.json mapping
+    each image url to its thumbnail and validators for revalidation"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / 'index.json'
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'failed': 0}
+
+    def save(self):
+        tmp = self.index_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def thumbnail_path(self, image_url):
+        entry = self.index.get(image_url)
+        if entry:
+            path = self.cache_dir / f"{entry['digest']}.jpg"
+            if path.exists():
+                return path
+        return None
+
+    def data_uri(self, image_url):
+        path = self.thumbnail_path(image_url)
+        if not path:
+            return None
+        return 'data:image/jpeg;base64,' + base64.b64encode(path.read_bytes()).decode('ascii')
+
+    async def refresh(self, session, image_url, semaphore):
+        """download or revalidate one image, storing a new thumbnail only
+        when the server sends changed content"""
+        headers = {'User-Agent': USER_AGENT}
+        entry = self.index.get(image_url)
+        if entry and self.thumbnail_path(image_url):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        async with semaphore:
+            try:
+                async with session.get(image_url, headers=headers) as response:
+                    if response.status == 304:
+                        self.stats['not_modified'] += 1
+                        return
+                    response.raise_for_status()
+                    data = await response.read()
+                    validators = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+                thumbnail = await asyncio.get_running_loop().run_in_executor(None, make_thumbnail, data)
+            except Exception:
+                self.stats['failed'] += 1
+                return
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self.cache_dir / f"{digest}.jpg"
+        if not path.exists():
+            path.write_bytes(thumbnail)
+        self.index[image_url] = {'digest': digest, **validators}
+        self.stats['downloaded'] += 1
+
+    async def refresh_all(self, image_urls, max_concurrent=20):
+        semaphore = asyncio.Semaphore(max_concurrent)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await tqdm_asyncio.gather(*[self.refresh(session, url, semaphore) for url in set(image_urls)],
+                                      desc="Fetching artwork")
+        self.save()
+
+
+def load_artwork(opml_filename, cache_dir=CACHE_DIR, refresh=True):
+    """returns dict of feed name -> thumbnail data uri for the feeds in an
+    OPML file, refreshing the cache first unless refresh is False"""
+    if Image is None:
+        raise RuntimeError("Artwork thumbnails need Pillow: pip install pillow")
+    feeds = parse_opml_artwork(opml_filename)
+    cache = ArtworkCache(cache_dir)
+    if refresh:
+        asyncio.run(cache.refresh_all(feeds.values()))
+        print(f"Artwork: {cache.stats['downloaded']} downloaded, {cache.stats['not_modified']} not modified, "
+              f"{cache.stats['failed']} failed", file=sys.stderr)
+    uris = {}
+    for name, image_url in feeds.items():
+        uri = cache.data_uri(image_url)
+        if uri:
+            uris[name] = uri
+    return uris
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        cache_dir = sys.argv[2] if len(sys.argv) >= 3 else CACHE_DIR
+        artwork = load_artwork(sys.argv[1], cache_dir)
+        print(f"{len(artwork)} feeds with cached artwork")
+    else:
+        print('mandatory argument [opml file], optional [cache dir]')
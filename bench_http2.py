@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Benchmark the aiohttp (HTTP/1.1) and httpx (HTTP/2) fetch backends
+# against a local TLS server that negotiates h2 or http/1.1 via ALPN
+import asyncio
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import h2.config
+import h2.connection
+import h2.events
+
+from memory_usage_optimized_2 import stream_process_feeds
+from mock_feed_server import make_feed
+
+
+def make_certificate(directory):
+    """self-signed certificate for 127.0.0.1, returns (certfile, keyfile)"""
+    certfile = Path(directory) / 'cert.pem'
+    keyfile = Path(directory) / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', str(keyfile), '-out', str(certfile)],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class BenchServer:
+    """serves make_feed bodies after `delay` seconds over HTTP/2 or
+    HTTP/1.1 keep-alive, counting TLS handshakes per protocol"""
+
+    def __init__(self, certfile, keyfile, delay=0.05):
+        self.delay = delay
+        self.handshakes = {'h2': 0, 'http/1.1': 0}
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.context.set_alpn_protocols(['h2', 'http/1.1'])
+        self.port = None
+        self._ready = threading.Event()
+
+    def body(self, path):
+        feed_index = path.rsplit('/', 1)[-1].split('.')[0]
+        return make_feed(feed_index, base_url=f"https://127.0.0.1:{self.port}").encode('utf-8')
+
+    async def handle(self, reader, writer):
+        protocol = writer.get_extra_info('ssl_object').selected_alpn_protocol() or 'http/1.1'
+        self.handshakes[protocol] += 1
+        try:
+            if protocol == 'h2':
+                await self.serve_h2(reader, writer)
+            else:
+                await self.serve_h1(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_h1(self, reader, writer):
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            path = head.split(b' ', 2)[1].decode('ascii')
+            await asyncio.sleep(self.delay)
+            body = self.body(path)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/rss+xml\r\n'
+                         b'Content-Length: %d\r\n\r\n' % len(body) + body)
+            await writer.drain()
+
+    async def serve_h2(self, reader, writer):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        window_open = asyncio.Event()
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(stream_id, path):
+            await asyncio.sleep(self.delay)
+            body = self.body(path)
+            async with lock:
+                conn.send_headers(stream_id, [(':status', '200'), ('content-type', 'application/rss+xml'),
+                                              ('content-length', str(len(body)))])
+            while body:
+                async with lock:
+                    size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(body))
+                    if size:
+                        conn.send_data(stream_id, body[:size], end_stream=size == len(body))
+                        body = body[size:]
+                    writer.write(conn.data_to_send())
+                if not size:
+                    window_open.clear()
+                    await window_open.wait()
+            await writer.drain()
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            async with lock:
+                events = conn.receive_data(data)
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    path = dict(event.headers)[b':path'].decode('ascii')
+                    task = asyncio.ensure_future(respond(event.stream_id, path))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                    window_open.set()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            async with lock:
+                writer.write(conn.data_to_send())
+            await writer.drain()
+
+    def start(self):
+        threading.Thread(target=asyncio.run, args=(self.serve_forever(),), daemon=True).start()
+        self._ready.wait()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle, '127.0.0.1', 0, ssl=self.context)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+async def run_backend(feed_info, max_concurrent_requests, http2, ssl_context):
+    urls = 0
+    async for result in stream_process_feeds(feed_info, max_concurrent_requests, 0,
+                                             desc='http2' if http2 else 'aiohttp',
+                                             http2=http2, ssl_context=ssl_context):
+        if not result['success']:
+            print(f"Failed: {result['name']} - {result['error']}")
+        urls += len(result['media_urls'])
+    return urls
+
+
+def main(feeds=500, max_concurrent_requests=50, delay=0.05):
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        server = BenchServer(certfile, keyfile, delay)
+        server.start()
+        ssl_context = ssl.create_default_context(cafile=str(certfile))
+        feed_info = [(f"Bench feed {i}", f"https://127.0.0.1:{server.port}/feed/{i}.xml") for i in range(feeds)]
+
+        print(f"{feeds} feeds on one host, {max_concurrent_requests} concurrent requests, {delay}s server delay")
+        for http2 in (False, True):
+            before = dict(server.handshakes)
+            start_time = time.time()
+            urls = asyncio.run(run_backend(feed_info, max_concurrent_requests, http2, ssl_context))
+            elapsed = time.time() - start_time
+            handshakes = {k: v - before[k] for k, v in server.handshakes.items()}
+            print(f"{'httpx http2' if http2 else 'aiohttp':12} {elapsed:6.2f} s  "
+                  f"TLS handshakes: {handshakes['h2']} h2, {handshakes['http/1.1']} http/1.1  "
+                  f"media urls: {urls}")
+
+
+if __name__ == '__main__':
+    args = [int(sys.argv[1]) if len(sys.argv) >= 2 else 500,
+            int(sys.argv[2]) if len(sys.argv) >= 3 else 50,
+            float(sys.argv[3]) if len(sys.argv) >= 4 else 0.05]
+    main(*args)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Indexed feed chunk files, merged into the combined JSON without reparsing
+import json
+import os
+import struct
+import sys
+
+MAGIC = b'PCCHUNK1'
+TRAILER = struct.Struct('<Q8s')   # index length, magic
+CHUNK_SUFFIX = '.chunk'
+INDEX_SUFFIX = '.idx'
+
+
+class _AsciiWriter:
+    """text facade over a binary file for SpilledBody.write_json_string"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, text):
+        self.f.write(text.encode('ascii'))
+
+
+class ChunkWriter:
+    """writes feeds as a JSON object, `{"name": "content", ...}`, followed
+    by an index footer of byte offsets, every chunk is self-contained so
+    any number can be written in parallel"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.f = open(path, 'wb')
+        self.f.write(b'{')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, name, content):
+        if self.entries:
+            self.f.write(b', ')
+        key_start = self.f.tell()
+        self.f.write(json.dumps(name).encode('ascii') + b': ')
+        value_start = self.f.tell()
+        if isinstance(content, str) or content is None:
+            self.f.write(json.dumps(content).encode('ascii'))
+        else:
+            content.write_json_string(_AsciiWriter(self.f))
+        self.entries.append([name, key_start, value_start, self.f.tell()])
+
+    def close(self):
+        self.f.write(b'}')
+        index = json.dumps({'body_end': self.f.tell(), 'entries': self.entries}).encode('ascii')
+        self.f.write(index)
+        self.f.write(TRAILER.pack(len(index), MAGIC))
+        self.f.close()
+
+
+def read_index(path):
+    """returns the footer of a chunk file, {'body_end', 'entries'}"""
+    with open(path, 'rb') as f:
+        f.seek(-TRAILER.size, os.SEEK_END)
+        length, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an indexed chunk")
+        f.seek(-(TRAILER.size + length), os.SEEK_END)
+        return json.loads(f.read(length))
+
+
+def read_value(path, start, end):
+    """decode one JSON value stored at [start, end) of path"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return json.loads(f.read(end - start))
+
+
+def read_feed(path, name):
+    """content of one feed from a chunk file or a combined JSON with an
+    .idx sidecar, seeking straight to it, None if absent"""
+    if str(path).endswith(CHUNK_SUFFIX):
+        offsets = {entry[0]: entry[2:] for entry in read_index(path)['entries']}
+    else:
+        with open(str(path) + INDEX_SUFFIX) as f:
+            offsets = json.load(f)
+    if name not in offsets:
+        return None
+    return read_value(path, *offsets[name])
+
+
+def splice(in_fd, out_fd, offset, count):
+    """copy count bytes from offset of in_fd to the position of out_fd,
+    in the kernel where the platform allows it"""
+    while count > 0:
+        try:
+            copied = os.copy_file_range(in_fd, out_fd, count, offset)
+        except (AttributeError, OSError):
+            try:
+                copied = os.sendfile(out_fd, in_fd, offset, count)
+            except (AttributeError, OSError):
+                copied = os.write(out_fd, os.pread(in_fd, min(count, 1024 * 1024), offset))
+        if copied == 0:
+            raise EOFError(f"unexpected end of chunk at offset {offset}")
+        offset += copied
+        count -= copied
+
+
+def combine_chunks(chunk_paths, combined_path):
+    """concatenate chunks into one JSON object by copying each chunk's
+    entry bytes as they are, and write a name -> [start, end] .idx sidecar
+    for seeking to single feeds in the result"""
+    combined_index = {}
+    out_fd = os.open(combined_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        position = os.write(out_fd, b'{')
+        for chunk_path in chunk_paths:
+            entries = read_index(chunk_path)['entries']
+            if not entries:
+                continue
+            if position > 1:
+                position += os.write(out_fd, b', ')
+            start, end = entries[0][1], entries[-1][3]
+            in_fd = os.open(chunk_path, os.O_RDONLY)
+            try:
+                splice(in_fd, out_fd, start, end - start)
+            finally:
+                os.close(in_fd)
+            for name, _, value_start, value_end in entries:
+                combined_index[name] = [value_start - start + position, value_end - start + position]
+            position += end - start
+        os.write(out_fd, b'}')
+    finally:
+        os.close(out_fd)
+    with open(str(combined_path) + INDEX_SUFFIX, 'w') as f:
+        json.dump(combined_index, f)
+    return combined_index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        content = read_feed(sys.argv[1], sys.argv[2])
+        if content is None:
+            print(f"{sys.argv[2]} not found in {sys.argv[1]}")
+            sys.exit(1)
+        print(content)
+    else:
+        print('mandatory arguments [chunk file or combined json] [feed name]')
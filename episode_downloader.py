@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# Parallel range-request episode downloader with resume
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+
+import aiohttp
+from tqdm.asyncio import tqdm_asyncio
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+MIN_SPLIT_SIZE = 2 * SEGMENT_SIZE
+PER_HOST_CONNECTIONS = 4
+MAX_CONCURRENT_EPISODES = 8
+READ_SIZE = 256 * 1024
+PROGRESS_INTERVAL = 2.0
+RESTARTS = 2
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+
+
+def output_name(url):
+    """local filename for url, prefixed with a short url hash since many
+    hosts reuse basenames like rssFileVip.mp3 across episodes"""
+    name = unquote(Path(urlsplit(url).path).name) or 'episode'
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:8] + '_' + name
+
+
+def preallocate(path, size):
+    """create path with size bytes reserved on disk, keeping existing data"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        elif os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+class ResourceChanged(Exception):
+    """the server is no longer serving the version being downloaded"""
+
+
+class Progress:
+    """per-segment bytes done for one download, persisted next to the
+    partial file so an interrupted download resumes where it stopped,
+    as long as the resource still has the same size and validator"""
+
+    def __init__(self, path, url, size, validator, segments):
+        self.path = path
+        self.state = {'url': url, 'size': size, 'validator': validator, 'segments': segments}
+        self._saved = 0.0
+
+    @classmethod
+    def load(cls, path, url, size, validator):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get('url') != url or state.get('size') != size or state.get('validator') != validator:
+            return None
+        return cls(path, url, size, validator, state['segments'])
+
+    def advance(self, index, count):
+        self.state['segments'][index][2] += count
+        if time.monotonic() - self._saved > PROGRESS_INTERVAL:
+            self.save()
+
+    def save(self):
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+        self._saved = time.monotonic()
+
+
+def plan_segments(size, segment_size=SEGMENT_SIZE):
+    """list of [start, end, done] byte ranges covering size bytes"""
+    return [[start, min(start + segment_size, size) - 1, 0] for start in range(0, size, segment_size)]
+
+
+def range_validator(headers):
+    """strong ETag, else Last-Modified, for If-Range, or None, weak ETags
+    can't be used since If-Range requires a strong comparison"""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def parse_content_range(value):
+    """(start, total) of a 'bytes start-end/total' header, None parts if absent"""
+    spec, _, total = value.partition('/')
+    start = spec.rpartition(' ')[2].partition('-')[0]
+    return int(start) if start.isdigit() else None, int(total) if total.isdigit() else None
+
+
+async def probe(session, url):
+    """return (final url, size or None, whether ranges are supported, validator)"""
+    headers = {'User-Agent': USER_AGENT, 'Range': 'bytes=0-0'}
+    async with session.get(url, headers=headers) as response:
+        final_url = str(response.url)
+        validator = range_validator(response.headers)
+        if response.status == 206:
+            _, total = parse_content_range(response.headers.get('Content-Range', ''))
+            return final_url, total, True, validator
+        response.raise_for_status()
+        return final_url, response.content_length, False, validator
+
+
+async def fetch_segment(session, url, fd, segment, index, progress, host_limit):
+    start, end, done = segment
+    if start + done > end:
+        return
+    async with host_limit:
+        headers = {'User-Agent': USER_AGENT, 'Range': f"bytes={start + done}-{end}"}
+        if progress.state['validator']:
+            headers['If-Range'] = progress.state['validator']
+        async with session.get(url, headers=headers) as response:
+            # with If-Range a changed resource comes back whole as a 200
+            if response.status == 200:
+                raise ResourceChanged(f"{url} changed while downloading")
+            if response.status != 206:
+                raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                  status=response.status, message='range not honoured')
+            # dynamically assembled files (ad insertion) differ per request
+            range_start, total = parse_content_range(response.headers.get('Content-Range', ''))
+            if range_start != start + done or total != progress.state['size']:
+                raise ResourceChanged(f"{url} served bytes {range_start}/{total}, "
+                                      f"expected {start + done}/{progress.state['size']}")
+            offset = start + done
+            async for chunk in response.content.iter_chunked(READ_SIZE):
+                # write straight into the preallocated file at the segment offset
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                progress.advance(index, len(chunk))
+            # a 206 may legally cover less than asked, leave the rest to a resume
+            if offset != end + 1:
+                raise aiohttp.ClientPayloadError(f"segment {start}-{end} stopped at byte {offset}")
+
+
+async def fetch_whole(session, url, part_path, host_limit):
+    async with host_limit:
+        async with session.get(url, headers={'User-Agent': USER_AGENT}) as response:
+            response.raise_for_status()
+            with open(part_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(READ_SIZE):
+                    f.write(chunk)
+
+
+async def fetch_ranges(session, url, part_path, progress_path, host_limits):
+    """one attempt at url into part_path, raises ResourceChanged when the
+    server switches to a different version part way"""
+    final_url, size, ranges, validator = await probe(session, url)
+    host_limit = host_limits[urlsplit(final_url).hostname]
+    if not ranges or not size:
+        await fetch_whole(session, final_url, part_path, host_limit)
+        return
+    progress = Progress.load(progress_path, url, size, validator)
+    if progress is None or not part_path.exists():
+        segment_size = SEGMENT_SIZE if size >= MIN_SPLIT_SIZE else size
+        progress = Progress(progress_path, url, size, validator, plan_segments(size, segment_size))
+    preallocate(part_path, size)
+    fd = os.open(part_path, os.O_WRONLY)
+    try:
+        # let every segment settle before the fd is closed
+        outcomes = await asyncio.gather(*[
+            fetch_segment(session, final_url, fd, segment, i, progress, host_limit)
+            for i, segment in enumerate(progress.state['segments'])
+        ], return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        changed = [error for error in errors if isinstance(error, ResourceChanged)]
+        if changed or errors:
+            raise (changed or errors)[0]
+    finally:
+        os.close(fd)
+        progress.save()
+
+
+async def download_episode(session, url, dest, host_limits):
+    """download url to dest, in concurrent range segments when the server
+    allows it, resuming from a previous .part/.progress pair if present,
+    bytes of a version the server no longer serves are thrown away"""
+    if dest.exists():
+        return {'url': url, 'path': dest, 'success': True, 'skipped': True}
+    part_path = dest.with_name(dest.name + '.part')
+    progress_path = dest.with_name(dest.name + '.progress')
+    try:
+        for attempt in range(RESTARTS + 1):
+            try:
+                await fetch_ranges(session, url, part_path, progress_path, host_limits)
+                break
+            except ResourceChanged:
+                for path in (part_path, progress_path):
+                    if path.exists():
+                        path.unlink()
+                if attempt == RESTARTS:
+                    raise
+        os.replace(part_path, dest)
+        if progress_path.exists():
+            progress_path.unlink()
+        return {'url': url, 'path': dest, 'success': True, 'skipped': False}
+    except Exception as e:
+        return {'url': url, 'path': dest, 'success': False, 'error': str(e)}
+
+
+async def download_episodes(urls, out_dir, max_concurrent=MAX_CONCURRENT_EPISODES,
+                            per_host=PER_HOST_CONNECTIONS):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(per_host))
+    episode_limit = asyncio.Semaphore(max_concurrent)
+    connector = aiohttp.TCPConnector(limit_per_host=per_host, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+
+    async def limited(session, url):
+        async with episode_limit:
+            return await download_episode(session, url, out_dir / output_name(url), host_limits)
+
+    results = []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [limited(session, url) for url in dict.fromkeys(urls)]
+        for future_result in tqdm_asyncio.as_completed(tasks, desc="Downloading episodes"):
+            result = await future_result
+            if not result['success']:
+                tqdm_asyncio.write(f"Failed: {result['url']} - {result['error']}")
+            results.append(result)
+    return results
+
+
+def main(urls_filename, out_dir, max_concurrent=MAX_CONCURRENT_EPISODES):
+    if urls_filename == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(urls_filename, 'r') as f:
+            lines = f.readlines()
+    urls = [line.strip() for line in lines if line.strip()]
+    start_time = time.time()
+    results = asyncio.run(download_episodes(urls, out_dir, max_concurrent))
+    successful = sum(1 for r in results if r['success'])
+    print(f"\nSummary: Downloaded {successful} of {len(results)} episodes to {out_dir}")
+    print(f"Total download time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python episode_downloader.py <urls_file or -> <output_dir> [max_concurrent_episodes]")
+        sys.exit(1)
+    max_concurrent = MAX_CONCURRENT_EPISODES
+    if len(sys.argv) >= 4:
+        try:
+            max_concurrent = int(sys.argv[3])
+        except ValueError:
+            print(f"Invalid value for max_concurrent_episodes: {sys.argv[3]}. Using default: {MAX_CONCURRENT_EPISODES}")
+    main(sys.argv[1], sys.argv[2], max_concurrent)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# Persistent memo of media url extraction, keyed by a hash of the raw feed body
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MAX_MEMO_BYTES = 256 * 1024 * 1024
+COMMIT_EVERY = 200
+
+
+def body_hasher():
+    """fast 128 bit hash for raw feed bodies, fed chunk by chunk"""
+    return hashlib.blake2b(digest_size=16)
+
+
+class ExtractionMemo:
+    """sqlite backed map of body digest -> extracted media urls and hub
+    link, trimmed to max_bytes on close, least recently used first, a
+    readonly memo keeps its writes in memory for the owner of the file to
+    apply, so shard processes never contend for the sqlite write lock,
+    entries made by a different extractor version are never returned"""
+
+    def __init__(self, path, version, max_bytes=MAX_MEMO_BYTES, readonly=False):
+        self.version = version
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.stale = False
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._puts = {}
+        self._touched = set()
+        if readonly:
+            self._db = sqlite3.connect(Path(path).absolute().as_uri() + '?mode=ro', uri=True,
+                                       check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS memo ('
+                             'digest TEXT PRIMARY KEY, value TEXT, size INTEGER, last_used REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            if self.stored_version() != version:
+                # results of another extractor, none of them can be trusted
+                self._db.execute('DELETE FROM memo')
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+            self._db.commit()
+        if readonly:
+            self.stale = self.stored_version() != version
+        # one thread owns the connection, the event loop only awaits it
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def stored_version(self):
+        try:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row and row[0]
+
+    def get(self, digest):
+        """return (media_urls, hub) stored for digest, or None"""
+        value = self._puts.get(digest)
+        if value is None and not self.stale:
+            row = self._db.execute('SELECT value FROM memo WHERE digest = ?', (digest,)).fetchone()
+            value = row and row[0]
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.readonly:
+            self._touched.add(digest)
+        else:
+            self._db.execute('UPDATE memo SET last_used = ? WHERE digest = ?', (time.time(), digest))
+            self._maybe_commit()
+        value = json.loads(value)
+        return set(value['media_urls']), tuple(value['hub']) if value['hub'] else None
+
+    def put(self, digest, media_urls, hub):
+        value = json.dumps({'media_urls': sorted(media_urls), 'hub': hub})
+        if self.readonly:
+            self._puts[digest] = value
+            return
+        self._db.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)',
+                         (digest, value, len(value), time.time()))
+        self._maybe_commit()
+
+    async def lookup(self, digest):
+        """get without blocking the event loop on sqlite"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, digest)
+
+    async def store(self, digest, media_urls, hub):
+        """put without blocking the event loop on sqlite"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.put, digest, media_urls, hub)
+
+    def updates(self):
+        """writes held back by a readonly memo, for apply on the writable one"""
+        return {'puts': self._puts, 'touched': sorted(self._touched)}
+
+    def apply(self, updates):
+        now = time.time()
+        self._db.executemany('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)',
+                             [(digest, value, len(value), now) for digest, value in updates['puts'].items()])
+        self._db.executemany('UPDATE memo SET last_used = ? WHERE digest = ?',
+                             [(now, digest) for digest in updates['touched']])
+        self._db.commit()
+
+    def _maybe_commit(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def evict(self):
+        """drop least recently used entries beyond max_bytes"""
+        self._db.execute('DELETE FROM memo WHERE digest IN ('
+                         'SELECT digest FROM (SELECT digest, SUM(size) OVER '
+                         '(ORDER BY last_used DESC, digest) AS running FROM memo) WHERE running > ?)',
+                         (self.max_bytes,))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self._executor.shutdown()
+        if not self.readonly:
+            self.evict()
+            self._db.commit()
+        self._db.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        db = sqlite3.connect(sys.argv[1])
+        count, size = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM memo').fetchone()
+        print(f"{count} memoised feed bodies, {size / 1024 / 1024:.1f} MB")
+    else:
+        print('mandatory argument [memo file]')
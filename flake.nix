@@ -20,6 +20,9 @@
           more-itertools
           tqdm
           aiohttp
+          httpx   # optional HTTP/2 fetch backend (--http2)
+          h2
+          pillow  # artwork thumbnails (artwork.py)
           # Add more as needed
         ]);
       in {
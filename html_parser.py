@@ -1,5 +1,6 @@
 #!/home/dd/anaconda3/bin/python
 # HTML formatting tool for powercasts output files
+import json
 import sys
 
 def url_list_to_htm(link_list, filename=False):
@@ -23,6 +24,49 @@ def url_list_to_htm(link_list, filename=False):
     return(links)
 
 
+ARTWORK_STYLE = ('<style>.art{display:inline-block;width:32px;height:32px;'
+                 'background-size:cover;vertical-align:middle;margin-right:4px}</style>')
+
+
+def stream_to_htm(lines, filename, artwork=None):
+    """takes iterable of lines (plain urls or JSONL episode records) and
+    filename, writes numbered HTML links as the lines arrive, optionally
+    dict of feed name -> thumbnail data uri to show feed artwork, episode
+    records replayed by a retried shard are skipped"""
+
+    i = 0
+    art_classes = {}
+    seen = set()
+    with open(filename, 'w') as f:
+        if artwork:
+            f.write(ARTWORK_STYLE)
+        for line in lines:
+            url = line.strip()
+            feed = None
+            if url.startswith('{'):
+                record = json.loads(url)
+                if record['type'] != 'episode':
+                    continue
+                url = record['url']
+                feed = record['feed']
+                if (feed, url) in seen:
+                    continue
+                seen.add((feed, url))
+            if not url:
+                continue
+            if artwork and feed in artwork:
+                # each thumbnail is inlined once, as a class the links reuse
+                if feed not in art_classes:
+                    art_classes[feed] = 'a' + str(len(art_classes))
+                    f.write('<style>.' + art_classes[feed] + '{background-image:url(' + artwork[feed] + ')}</style>')
+                f.write('<span class="art ' + art_classes[feed] + '"></span>')
+            f.write('#' + str(i) + ' ' + '<a href="' + url + '">' + url + '</a>')
+            f.write(" <br> ")
+            f.flush()
+            i += 1
+    print('Wrote file ' + filename)
+
+
 def read_file_to_list(filename):
     """read content of file into list (internal)"""
 
@@ -33,9 +77,17 @@ def read_file_to_list(filename):
 
 if __name__ == '__main__':
     # check for number of arguments
-    if len(sys.argv) == 3:
+    if len(sys.argv) == 5 and sys.argv[1] == '-' and sys.argv[3] == '--artwork':
+        from artwork import load_artwork
+        stream_to_htm(sys.stdin, sys.argv[2], load_artwork(sys.argv[4]))
+
+    elif len(sys.argv) == 3 and sys.argv[1] == '-':
+        stream_to_htm(sys.stdin, sys.argv[2])
+
+    elif len(sys.argv) == 3:
         file_content = read_file_to_list(sys.argv[1])
         result = url_list_to_htm(file_content, sys.argv[2])
 
     else:
-        print('mandatory arguments [filename to read] [filename to write]')
\ No newline at end of file
+        print('mandatory arguments [filename to read, or - for stdin] [filename to write]')
+        print('optional, with - only: --artwork [opml file]')
\ No newline at end of file
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# Local LRU media cache with prefetch, serves episodes to VLC from disk
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit
+
+CACHE_DIR = Path.home() / '.cache' / 'powercasts'
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+PREFETCH_AHEAD = 3
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+
+
+class MediaCache:
+    """size-bounded directory of downloaded episodes, least recently used
+    files (by mtime, touched on every read) are evicted first"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path_for(self, url):
+        suffix = Path(urlsplit(url).path).suffix[:5]
+        return self.cache_dir / (hashlib.sha256(url.encode('utf-8')).hexdigest()[:32] + suffix)
+
+    def get(self, url):
+        """return path of cached file and mark it as recently used, or None"""
+        path = self.path_for(url)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def fetch(self, url):
+        """download url into the cache unless already there, returns path"""
+        path = self.get(url)
+        if path:
+            return path
+        path = self.path_for(url)
+        part = path.with_name(path.name + f".{threading.get_ident()}.part")
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response, open(part, 'wb') as f:
+                shutil.copyfileobj(response, f, 1024 * 1024)
+            os.replace(part, path)
+        finally:
+            if part.exists():
+                part.unlink()
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """remove least recently used files until under max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if keep and path == str(keep):
+                    continue
+                os.unlink(path)
+                total -= size
+
+
+class Prefetcher(threading.Thread):
+    """background thread keeping the next `ahead` episodes of the queue,
+    counted from the last one requested by the player, in the cache"""
+
+    def __init__(self, cache, queue, ahead=PREFETCH_AHEAD):
+        super().__init__(daemon=True)
+        self.cache = cache
+        self.queue = queue
+        self.ahead = ahead
+        self.position = -1
+        self._next = 0
+        self._changed = threading.Condition()
+
+    def played(self, index):
+        with self._changed:
+            self.position = max(self.position, index)
+            self._next = max(self._next, index + 1)
+            self._changed.notify()
+
+    def run(self):
+        while True:
+            with self._changed:
+                while self._next >= min(len(self.queue), self.position + 1 + self.ahead):
+                    self._changed.wait()
+                index = self._next
+                self._next += 1
+            try:
+                self.cache.fetch(self.queue[index])
+            except Exception as e:
+                print(f"Prefetch failed for {self.queue[index]}: {e}", file=sys.stderr)
+
+
+class CacheProxyHandler(BaseHTTPRequestHandler):
+    """serves /<n> as the n-th queued episode, from disk with range support
+    when cached, otherwise redirects the player to the original url"""
+
+    def do_GET(self):
+        server = self.server
+        try:
+            index = int(self.path.strip('/').split('.')[0])
+            url = server.queue[index]
+        except (ValueError, IndexError):
+            self.send_error(404)
+            return
+        server.prefetcher.played(index)
+        path = server.cache.get(url)
+        if path is None:
+            self.send_response(302)
+            self.send_header('Location', url)
+            self.end_headers()
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[len('bytes='):].split(',')[0].partition('-')
+            try:
+                if first:
+                    start = int(first)
+                    end = int(last) if last else size - 1
+                elif last:
+                    start = max(0, size - int(last))
+            except ValueError:
+                # malformed range, answered like an unsatisfiable one
+                start, end = 1, 0
+            end = min(end, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            try:
+                self.connection.sendfile(f, start, end - start + 1)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_proxy(cache, queue, ahead=PREFETCH_AHEAD, port=0):
+    """start prefetcher and proxy threads, returns the running server"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), CacheProxyHandler)
+    server.daemon_threads = True
+    server.cache = cache
+    server.queue = queue
+    server.prefetcher = Prefetcher(cache, queue, ahead)
+    server.prefetcher.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def play(urls, ahead=PREFETCH_AHEAD):
+    """play urls with VLC through the caching proxy, blocks until VLC exits"""
+    cache = MediaCache()
+    # VLC starts at once, an uncached first episode streams from the origin
+    # via the proxy's redirect while the prefetcher caches it and the next
+    server = start_proxy(cache, urls, ahead)
+    base = f"http://127.0.0.1:{server.server_port}"
+    playlist = [f"{base}/{i}{Path(urlsplit(url).path).suffix}" for i, url in enumerate(urls)]
+    subprocess.run(['vlc', *playlist], stderr=subprocess.DEVNULL)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    urls = [line.strip() for line in sys.stdin if line.strip()]
+    if urls:
+        ahead = int(sys.argv[1]) if len(sys.argv) >= 2 else PREFETCH_AHEAD
+        play(urls, ahead)
+    else:
+        print('pipe episode urls on stdin, optional argument [episodes to prefetch]')
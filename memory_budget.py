@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# Memory budget for in-flight feed bodies, large bodies spill to temp files
+import asyncio
+import codecs
+import json
+import mmap
+import os
+import tempfile
+
+from extraction_memo import body_hasher
+
+DECODE_BLOCK = 1024 * 1024
+
+
+class MemoryBudget:
+    """bytes of feed bodies held in memory between fetch and write, every
+    chunk is reserved before it is buffered and a body whose next chunk
+    doesn't fit goes to a temp file, so held never exceeds limit whatever
+    the concurrency, bodies larger than spill_threshold are spilled early
+    to leave room for the rest and new fetches wait while nothing is left"""
+
+    def __init__(self, limit, spill_threshold=None, spill_dir=None):
+        self.limit = limit
+        self.spill_threshold = spill_threshold or limit // 8
+        self.spill_dir = spill_dir
+        self.held = 0
+        self.peak = 0
+        self.spilled = 0
+        self._released = asyncio.Condition()
+
+    async def wait(self):
+        """block until the budget has room for another body"""
+        async with self._released:
+            await self._released.wait_for(lambda: self.held < self.limit)
+
+    def reserve(self, count):
+        """take count bytes from the budget, False if they don't fit"""
+        if self.held + count > self.limit:
+            return False
+        self.held += count
+        self.peak = max(self.peak, self.held)
+        return True
+
+    async def release(self, count):
+        async with self._released:
+            self.held -= count
+            self._released.notify_all()
+
+
+class SpilledBody:
+    """feed body kept in a temp file instead of a str, scanned via mmap"""
+
+    def __init__(self, path, size, encoding):
+        self.path = path
+        self.size = size
+        self.encoding = encoding
+
+    def __bool__(self):
+        return self.size > 0
+
+    @property
+    def ascii_compatible(self):
+        return 'a'.encode(self.encoding, 'replace') == b'a'
+
+    def findall(self, pattern, bytes_pattern):
+        """findall of pattern, using its bytes twin on the mapped file when
+        the encoding allows it"""
+        if not self.ascii_compatible:
+            return pattern.findall(self.text())
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [m.decode(self.encoding, 'replace') for m in bytes_pattern.findall(mm)]
+
+    def search(self, pattern, bytes_pattern):
+        """first match group 1 or None, see findall"""
+        if not self.ascii_compatible:
+            match = pattern.search(self.text())
+            return match.group(1) if match else None
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            match = bytes_pattern.search(mm)
+            return match.group(1).decode(self.encoding, 'replace') if match else None
+
+    def iter_text(self, block=DECODE_BLOCK):
+        decoder = codecs.getincrementaldecoder(self.encoding)('replace')
+        with open(self.path, 'rb') as f:
+            while True:
+                data = f.read(block)
+                if not data:
+                    break
+                yield decoder.decode(data)
+        yield decoder.decode(b'', final=True)
+
+    def head(self, block=DECODE_BLOCK):
+        """decoded first block, enough for channel-level elements"""
+        return next(self.iter_text(block))
+
+    def text(self):
+        return ''.join(self.iter_text())
+
+    def write_json_string(self, out):
+        """write the body as a JSON string literal without holding it all"""
+        out.write('"')
+        for piece in self.iter_text():
+            out.write(json.dumps(piece)[1:-1])
+        out.write('"')
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def body_encoding(charset):
+    """codec name for a response charset label, utf-8 when it is missing
+    or unknown to Python, as aiohttp's response.text() falls back"""
+    try:
+        return codecs.lookup(charset).name if charset else 'utf-8'
+    except LookupError:
+        return 'utf-8'
+
+
+async def collect_body(chunks, charset, budget=None):
+    """read an async iterator of byte chunks, returns (content, digest,
+    bytes held in memory), content being a str or a SpilledBody once the
+    body outgrows budget.spill_threshold or what is left of the budget"""
+    encoding = body_encoding(charset)
+    hasher = body_hasher()
+    buffer = bytearray()
+    spill = None
+    size = 0
+    try:
+        async for chunk in chunks:
+            hasher.update(chunk)
+            size += len(chunk)
+            if spill:
+                spill.write(chunk)
+                continue
+            if budget and (len(buffer) + len(chunk) > budget.spill_threshold
+                           or not budget.reserve(len(chunk))):
+                spill = tempfile.NamedTemporaryFile(dir=budget.spill_dir, prefix='feed_', delete=False)
+                spill.write(buffer)
+                spill.write(chunk)
+                await budget.release(len(buffer))
+                budget.spilled += 1
+                buffer = bytearray()
+                continue
+            buffer += chunk
+    except BaseException:
+        if budget and not spill:
+            await budget.release(len(buffer))
+        if spill:
+            spill.close()
+            os.unlink(spill.name)
+        raise
+    if spill:
+        spill.close()
+        return SpilledBody(spill.name, size, encoding), hasher.hexdigest(), 0
+    return buffer.decode(encoding, 'replace'), hasher.hexdigest(), len(buffer) if budget else 0
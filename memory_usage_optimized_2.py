@@ -1,5 +1,6 @@
 import re
 import json
+import hashlib
 import sys
 import time
 import asyncio
@@ -8,9 +9,19 @@ from pathlib import Path
 from tqdm.asyncio import tqdm_asyncio
 import multiprocessing
 import os
+import shutil
 from functools import partial
 from concurrent.futures import ProcessPoolExecutor
 
+from extraction_memo import ExtractionMemo
+from memory_budget import MemoryBudget, SpilledBody, collect_body
+from chunk_store import ChunkWriter, CHUNK_SUFFIX, combine_chunks
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 CHUNK_SIZE = 50
 
 
@@ -34,14 +45,55 @@ def parse_opml_file(file_path):
     return feed_info
 
 MEDIA_URL_PATTERN = re.compile(r'"(http\S+?\.(?:mp3|mp4))["?]', re.IGNORECASE)
+MEDIA_URL_PATTERN_BYTES = re.compile(MEDIA_URL_PATTERN.pattern.encode('ascii'), re.IGNORECASE)
 
 def extract_media_urls(content):
     if not content:
         return set()
+    if isinstance(content, SpilledBody):
+        return set(content.findall(MEDIA_URL_PATTERN, MEDIA_URL_PATTERN_BYTES))
     return set(MEDIA_URL_PATTERN.findall(content))
 
-async def fetch_feed(session, name, url, semaphore):
+def find_newest_url(content):
+    """first media url in a feed body, the newest episode as newest.py picks it"""
+    if not content:
+        return None
+    if isinstance(content, SpilledBody):
+        return content.search(MEDIA_URL_PATTERN, MEDIA_URL_PATTERN_BYTES)
+    match = MEDIA_URL_PATTERN.search(content)
+    return match.group(1) if match else None
+
+LINK_TAG_PATTERN = re.compile(r'<(?:atom:)?link\s[^>]*>', re.IGNORECASE)
+LINK_ATTR_PATTERN = re.compile(r'(rel|href)\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+def extract_hub_link(content):
+    """return (hub, topic) advertised by a feed for WebSub, or None"""
+    if isinstance(content, SpilledBody):
+        content = content.head()
+    if not content or 'hub' not in content:
+        return None
+    hub = topic = None
+    for tag in LINK_TAG_PATTERN.findall(content):
+        attrs = {k.lower(): v for k, v in LINK_ATTR_PATTERN.findall(tag)}
+        if attrs.get('rel') == 'hub' and not hub:
+            hub = attrs.get('href')
+        elif attrs.get('rel') == 'self' and not topic:
+            topic = attrs.get('href')
+    if not hub:
+        return None
+    return hub, topic
+
+# bump when extraction logic changes in ways the patterns don't show
+EXTRACTOR_REVISION = 1
+# memoised extractions are only reused while this matches
+EXTRACTOR_VERSION = hashlib.sha256('\n'.join(
+    [str(EXTRACTOR_REVISION)] + [p.pattern for p in (MEDIA_URL_PATTERN, LINK_TAG_PATTERN, LINK_ATTR_PATTERN)]
+).encode('utf-8')).hexdigest()[:16]
+
+async def fetch_feed(session, name, url, semaphore, budget=None):
     async with semaphore:
+        if budget:
+            await budget.wait()
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
@@ -50,94 +102,285 @@ async def fetch_feed(session, name, url, semaphore):
             async with session.get(url, headers=headers, timeout=timeout) as response:
                 if response.status != 200:
                     return {'name': name, 'url': url, 'content': None, 'media_urls': set(), 'success': False, 'error': f"HTTP error: {response.status}"}
-                content = await response.text()
-                return {'name': name, 'url': url, 'content': content, 'success': True}
+                content, digest, held = await collect_body(response.content.iter_any(), response.charset, budget)
+                return {'name': name, 'url': url, 'content': content, 'digest': digest, 'held': held, 'success': True}
         except Exception as e:
             return {'name': name, 'url': url, 'content': None, 'media_urls': set(), 'success': False, 'error': str(e)}
 
-async def stream_process_feeds(feed_info, max_concurrent_requests, process_pool_size):
-    semaphore = asyncio.Semaphore(max_concurrent_requests)
-    process_pool = ProcessPoolExecutor(max_workers=process_pool_size)
-    connector = aiohttp.TCPConnector(limit=max_concurrent_requests, ttl_dns_cache=300)
+async def fetch_feed_http2(client, name, url, semaphore, budget=None):
+    """fetch_feed for an httpx client, requests to the same host share one
+    multiplexed connection when ALPN negotiates h2, else HTTP/1.1 is used"""
+    async with semaphore:
+        if budget:
+            await budget.wait()
+        try:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+            }
+            async with client.stream('GET', url, headers=headers, timeout=15) as response:
+                if response.status_code != 200:
+                    return {'name': name, 'url': url, 'content': None, 'media_urls': set(), 'success': False, 'error': f"HTTP error: {response.status_code}"}
+                content, digest, held = await collect_body(response.aiter_bytes(), response.charset_encoding, budget)
+                return {'name': name, 'url': url, 'content': content, 'digest': digest, 'held': held, 'success': True}
+        except Exception as e:
+            return {'name': name, 'url': url, 'content': None, 'media_urls': set(), 'success': False, 'error': str(e)}
+
+def open_session(max_concurrent_requests, http2=False, ssl_context=None):
+    """returns (client session, matching fetch function) for the chosen backend"""
+    if http2:
+        if httpx is None:
+            raise RuntimeError("The HTTP/2 backend needs httpx with h2: pip install 'httpx[http2]'")
+        limits = httpx.Limits(max_connections=max_concurrent_requests)
+        client = httpx.AsyncClient(http2=True, limits=limits, timeout=20, follow_redirects=True,
+                                   verify=ssl_context or True)
+        return client, fetch_feed_http2
+    connector = aiohttp.TCPConnector(limit=max_concurrent_requests, ttl_dns_cache=300,
+                                     ssl=ssl_context or True)
     timeout = aiohttp.ClientTimeout(total=20)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout), fetch_feed
+
+async def stream_process_feeds(feed_info, max_concurrent_requests, process_pool_size, desc="Fetching feeds",
+                               http2=False, ssl_context=None, memo=None, budget=None):
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    process_pool = ProcessPoolExecutor(max_workers=process_pool_size) if process_pool_size else None
+    session, fetch = open_session(max_concurrent_requests, http2, ssl_context)
 
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = [fetch_feed(session, name, url, semaphore) for name, url in feed_info]
-        for future_result in tqdm_asyncio.as_completed(tasks, desc="Fetching feeds"):
+    async with session:
+        tasks = [fetch(session, name, url, semaphore, budget) for name, url in feed_info]
+        for future_result in tqdm_asyncio.as_completed(tasks, desc=desc):
             result = await future_result
-            if result['success']:
-                future = process_pool.submit(extract_media_urls, result['content'])
-                result['media_urls'] = future.result()
-            else:
+            if not result['success']:
                 result['media_urls'] = set()
+                result['hub'] = None
+            elif memo and (memoised := await memo.lookup(result['digest'])):
+                result['media_urls'], result['hub'] = memoised
+            else:
+                result['hub'] = extract_hub_link(result['content'])
+                if process_pool:
+                    future = process_pool.submit(extract_media_urls, result['content'])
+                    result['media_urls'] = future.result()
+                else:
+                    result['media_urls'] = extract_media_urls(result['content'])
+                if memo:
+                    await memo.store(result['digest'], result['media_urls'], result['hub'])
+            content, held = result['content'], result.get('held')
             yield result
-    process_pool.shutdown()
+            # the consumer is done with this result once it asks for the next
+            if isinstance(content, SpilledBody):
+                content.unlink()
+            if budget and held:
+                await budget.release(held)
+    if process_pool:
+        process_pool.shutdown()
+
+def open_jsonl(jsonl_path):
+    """stdout for '-', else path opened for appending so shard workers can
+    share one file or FIFO, each record going out as a single write"""
+    if jsonl_path == '-':
+        return sys.stdout
+    return open(jsonl_path, 'a')
+
+def write_jsonl_records(jsonl_file, result):
+    """emit one feed record followed by one record per episode"""
+    records = [{'type': 'feed', 'name': result['name'], 'url': result['url'], 'success': result['success'],
+                'error': result.get('error'), 'newest': find_newest_url(result['content']),
+                'episodes': len(result['media_urls'])}]
+    records.extend({'type': 'episode', 'feed': result['name'], 'url': media_url}
+                   for media_url in result['media_urls'])
+    for record in records:
+        jsonl_file.write(json.dumps(record) + '\n')
+        jsonl_file.flush()
 
-async def write_results_streaming(results_async_gen, txt_path, chunk_dir):
+async def write_results_streaming(results_async_gen, txt_path, chunk_dir, jsonl_file=None):
     os.makedirs(chunk_dir, exist_ok=True)
+    for stale in Path(chunk_dir).glob(f"feeds_chunk_*{CHUNK_SUFFIX}"):
+        stale.unlink()
     chunk_index = 0
-    current_chunk = {}
+    chunk = None
     with open(txt_path, 'w') as output_file:
         async for result in results_async_gen:
+            if jsonl_file:
+                write_jsonl_records(jsonl_file, result)
             if result['success']:
                 for media_url in result['media_urls']:
                     output_file.write(f"{media_url}\n")
-                current_chunk[result['name']] = result['content']
-                if len(current_chunk) >= CHUNK_SIZE:
-                    chunk_path = os.path.join(chunk_dir, f"feeds_chunk_{chunk_index:03}.json")
-                    with open(chunk_path, 'w') as chunk_file:
-                        json.dump(current_chunk, chunk_file)
-                    current_chunk.clear()
+                # entries go straight into the open chunk file rather than
+                # holding CHUNK_SIZE bodies in memory until the chunk is full
+                if chunk is None:
+                    chunk = ChunkWriter(os.path.join(chunk_dir, f"feeds_chunk_{chunk_index:03}{CHUNK_SUFFIX}"))
+                chunk.add(result['name'], result['content'])
+                if len(chunk) >= CHUNK_SIZE:
+                    chunk.close()
+                    chunk = None
                     chunk_index += 1
             result['content'] = None
-        if current_chunk:
-            chunk_path = os.path.join(chunk_dir, f"feeds_chunk_{chunk_index:03}.json")
-            with open(chunk_path, 'w') as chunk_file:
-                json.dump(current_chunk, chunk_file)
+        if chunk:
+            chunk.close()
 
 async def combine_json_chunks(chunk_dir, combined_path):
-    chunk_files = sorted(Path(chunk_dir).glob("feeds_chunk_*.json"))
-    with open(combined_path, 'w') as outfile:
-        outfile.write('{')
-        first = True
-        for chunk_file in chunk_files:
-            with open(chunk_file, 'r') as infile:
-                chunk_data = json.load(infile)
-                for k, v in chunk_data.items():
-                    if not first:
-                        outfile.write(',')
-                    else:
-                        first = False
-                    outfile.write(f"{json.dumps(k)}:{json.dumps(v)}")
-        outfile.write('}')
-
-async def main_async(opml_filename, max_concurrent_requests=20):
+    """splice the indexed chunks into the combined JSON, no decoding involved"""
+    chunk_files = sorted(Path(chunk_dir).glob(f"feeds_chunk_*{CHUNK_SUFFIX}"))
+    combine_chunks(chunk_files, combined_path)
+
+def fetch_shard(shard_index, shard_feed_info, shard_dir, max_concurrent_requests, http2=False, memo_path=None,
+                jsonl_path=None, memory_budget=None):
+    """worker process entry point, fetches one shard on its own event loop
+    and connection pool, media urls are extracted inline since the shard
+    already has a core to itself, memo writes are handed back to the
+    parent in memo_updates.json rather than written to the shared file"""
+    shard_dir = Path(shard_dir)
+    memo = ExtractionMemo(memo_path, EXTRACTOR_VERSION, readonly=True) if memo_path else None
+    budget = MemoryBudget(memory_budget) if memory_budget else None
+    results_async_gen = stream_process_feeds(shard_feed_info, max_concurrent_requests, 0,
+                                             desc=f"Shard {shard_index}", http2=http2, memo=memo, budget=budget)
+    jsonl_file = open_jsonl(jsonl_path) if jsonl_path else None
+    asyncio.run(write_results_streaming(results_async_gen, shard_dir / 'urls.txt', shard_dir / 'chunks', jsonl_file))
+    if jsonl_file and jsonl_file is not sys.stdout:
+        jsonl_file.close()
+    if memo:
+        memo.close()
+        with open(shard_dir / 'memo_stats.json', 'w') as stats_file:
+            json.dump(memo.stats(), stats_file)
+        with open(shard_dir / 'memo_updates.json', 'w') as updates_file:
+            json.dump(memo.updates(), updates_file)
+    return shard_index
+
+
+def run_shards(feed_info, shards, work_dir, max_concurrent_requests, retries=2, http2=False, memo_path=None,
+               jsonl_path=None, memory_budget=None):
+    """fetch feed_info split across shards worker processes, each shard
+    runs in its own process so a crash only costs that shard, failed shards
+    are retried without redoing the finished ones, returns list of shard
+    directories in shard order"""
+    shard_dirs = [Path(work_dir) / f"shard_{i:03}" for i in range(shards)]
+    # spawn rather than fork so workers don't inherit the parent's event loop
+    context = multiprocessing.get_context('spawn')
+    pending = {i: feed_info[i::shards] for i in range(shards)}
+    # each shard holds at most its share, so together they stay within the budget
+    shard_budget = memory_budget // shards if memory_budget else None
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying shards {sorted(pending)} (attempt {attempt + 1})", file=sys.stderr)
+        workers = {
+            i: context.Process(target=fetch_shard, args=(i, feeds, shard_dirs[i], max_concurrent_requests,
+                                                               http2, memo_path, jsonl_path, shard_budget))
+            for i, feeds in pending.items()
+        }
+        for worker in workers.values():
+            worker.start()
+        for i, worker in workers.items():
+            worker.join()
+            if worker.exitcode == 0:
+                del pending[i]
+            else:
+                print(f"Shard {i} failed with exit code {worker.exitcode}", file=sys.stderr)
+    if pending:
+        raise RuntimeError(f"Shards {sorted(pending)} failed after {retries + 1} attempts")
+    return shard_dirs
+
+
+def merge_shards(shard_dirs, txt_path, chunk_dir, memo=None):
+    """concatenate shard url lists into txt_path, renumber shard chunk
+    files into chunk_dir for combine_json_chunks and apply shard memo
+    updates to memo, returns summed memo stats"""
+    os.makedirs(chunk_dir, exist_ok=True)
+    for stale in Path(chunk_dir).glob(f"feeds_chunk_*{CHUNK_SUFFIX}"):
+        stale.unlink()
+    chunk_index = 0
+    memo_stats = {'hits': 0, 'misses': 0}
+    with open(txt_path, 'w') as output_file:
+        for shard_dir in shard_dirs:
+            if (shard_dir / 'memo_stats.json').exists():
+                with open(shard_dir / 'memo_stats.json', 'r') as stats_file:
+                    for k, v in json.load(stats_file).items():
+                        memo_stats[k] += v
+            if memo and (shard_dir / 'memo_updates.json').exists():
+                with open(shard_dir / 'memo_updates.json', 'r') as updates_file:
+                    memo.apply(json.load(updates_file))
+            with open(shard_dir / 'urls.txt', 'r') as shard_file:
+                shutil.copyfileobj(shard_file, output_file)
+            for chunk_file in sorted((shard_dir / 'chunks').glob(f"feeds_chunk_*{CHUNK_SUFFIX}")):
+                # chunk offsets are file-relative, so shard chunks move as they are
+                os.replace(chunk_file, os.path.join(chunk_dir, f"feeds_chunk_{chunk_index:03}{CHUNK_SUFFIX}"))
+                chunk_index += 1
+    return memo_stats
+
+
+async def main_async(opml_filename, max_concurrent_requests=20, shards=1, http2=False, jsonl_path=None,
+                     memory_budget=None):
     file_path = Path(opml_filename)
     base_name = file_path.stem
     txt_path = file_path.with_suffix('.txt')
     chunk_dir = file_path.parent / f"{base_name}_chunks"
     json_path = file_path.with_suffix('.json')
+    memo_path = file_path.parent / f"{base_name}_memo.sqlite"
+    # keep stdout clean for the record stream
+    log = sys.stderr if jsonl_path == '-' else sys.stdout
+    if jsonl_path and jsonl_path != '-' and not Path(jsonl_path).is_fifo():
+        open(jsonl_path, 'w').close()
 
     feed_info = parse_opml_file(file_path)
-    print(f"Found {len(feed_info)} feeds in {opml_filename}")
+    print(f"Found {len(feed_info)} feeds in {opml_filename}", file=log)
     cpu_count = multiprocessing.cpu_count()
     process_pool_size = max(1, cpu_count - 1)
     start_time = time.time()
-    results_async_gen = stream_process_feeds(feed_info, max_concurrent_requests, process_pool_size)
-    await write_results_streaming(results_async_gen, txt_path, chunk_dir)
+    budget = None
+    # opened before any shard starts so the file and table exist for them
+    memo = ExtractionMemo(memo_path, EXTRACTOR_VERSION)
+    if shards > 1:
+        shards_dir = file_path.parent / f"{base_name}_shards"
+        # hold a writer open so a FIFO reader doesn't see EOF between shards
+        jsonl_holder = open(jsonl_path, 'a') if jsonl_path and jsonl_path != '-' else None
+        shard_dirs = await asyncio.get_running_loop().run_in_executor(
+            None, run_shards, feed_info, shards, shards_dir, max_concurrent_requests, 2, http2, memo_path,
+            jsonl_path, memory_budget)
+        if jsonl_holder:
+            jsonl_holder.close()
+        memo_stats = merge_shards(shard_dirs, txt_path, chunk_dir, memo)
+        memo.close()
+        shutil.rmtree(shards_dir)
+    else:
+        budget = MemoryBudget(memory_budget) if memory_budget else None
+        results_async_gen = stream_process_feeds(feed_info, max_concurrent_requests, process_pool_size,
+                                                 http2=http2, memo=memo, budget=budget)
+        jsonl_file = open_jsonl(jsonl_path) if jsonl_path else None
+        await write_results_streaming(results_async_gen, txt_path, chunk_dir, jsonl_file)
+        if jsonl_file and jsonl_file is not sys.stdout:
+            jsonl_file.close()
+        memo.close()
+        memo_stats = memo.stats()
     await combine_json_chunks(chunk_dir, json_path)
     end_time = time.time()
-    print(f"\nSummary: Finished processing {len(feed_info)} feeds")
-    print(f"Total processing time: {end_time - start_time:.2f} seconds")
-    print(f"Media URLs saved to: {txt_path}")
-    print(f"RSS content saved to: {json_path}")
+    print(f"\nSummary: Finished processing {len(feed_info)} feeds", file=log)
+    print(f"Total processing time: {end_time - start_time:.2f} seconds", file=log)
+    print(f"Extraction memo: {memo_stats['hits']} hits, {memo_stats['misses']} misses", file=log)
+    if shards <= 1 and budget:
+        print(f"Memory budget: peak {budget.peak / 1024 / 1024:.1f} of {budget.limit / 1024 / 1024:.0f} MB held, "
+              f"{budget.spilled} bodies spilled to disk", file=log)
+    print(f"Media URLs saved to: {txt_path}", file=log)
+    print(f"RSS content saved to: {json_path}", file=log)
 
-def main(opml_filename, max_concurrent_requests=20):
-    asyncio.run(main_async(opml_filename, max_concurrent_requests))
+def main(opml_filename, max_concurrent_requests=20, shards=1, http2=False, jsonl_path=None, memory_budget=None):
+    asyncio.run(main_async(opml_filename, max_concurrent_requests, shards, http2, jsonl_path, memory_budget))
 
 if __name__ == '__main__':
+    http2 = '--http2' in sys.argv
+    if http2:
+        sys.argv.remove('--http2')
+    jsonl_path = None
+    if '--jsonl' in sys.argv:
+        index = sys.argv.index('--jsonl')
+        jsonl_path = sys.argv[index + 1] if index + 1 < len(sys.argv) else '-'
+        del sys.argv[index:index + 2]
+    memory_budget = None
+    if '--memory-budget' in sys.argv:
+        index = sys.argv.index('--memory-budget')
+        memory_budget = int(sys.argv[index + 1]) * 1024 * 1024
+        del sys.argv[index:index + 2]
     if len(sys.argv) < 2:
-        print("Usage: python opml_parser.py <opml_file> [max_concurrent_requests]")
+        print("Usage: python opml_parser.py <opml_file> [max_concurrent_requests] [shards] [--http2] [--jsonl <path or ->] [--memory-budget <MB>]")
         sys.exit(1)
     max_concurrent = 20
     if len(sys.argv) >= 3:
@@ -145,4 +388,10 @@ if __name__ == '__main__':
             max_concurrent = int(sys.argv[2])
         except ValueError:
             print(f"Invalid value for max_concurrent_requests: {sys.argv[2]}. Using default: 20")
-    main(sys.argv[1], max_concurrent)
+    shards = 1
+    if len(sys.argv) >= 4:
+        try:
+            shards = int(sys.argv[3])
+        except ValueError:
+            print(f"Invalid value for shards: {sys.argv[3]}. Using default: 1")
+    main(sys.argv[1], max_concurrent, shards, http2, jsonl_path, memory_budget)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# Local stand-in feed server for exercising the fetchers without the network
+import hashlib
+import hmac
+import secrets
+import struct
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlencode
+
+EPISODES_PER_FEED = 50
+MEDIA_SIZE = 256 * 1024
+HUB_EVERY = 2
+
+
+def make_feed(feed_index, episodes=EPISODES_PER_FEED, base_url='http://127.0.0.1', hub=False):
+    """returns RSS text for a synthetic feed, newest episode first, with
+    WebSub hub and self links when hub is set"""
+    items = []
+    for i in reversed(range(episodes)):
+        media_url = f"{base_url}/media/{feed_index}/episode_{i}.mp3"
+        items.append(f'<item><title>Episode {i}</title>'
+                     f'<enclosure url="{media_url}" type="audio/mpeg" length="1000"/></item>')
+    links = ''
+    if hub:
+        links = (f'<atom:link rel="hub" href="{base_url}/hub"/>'
+                 f'<atom:link rel="self" href="{base_url}/feed/{feed_index}.xml"/>')
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+            f'<title>Mock feed {feed_index}</title>{links}{"".join(items)}</channel></rss>')
+
+
+def make_media(path, size=MEDIA_SIZE):
+    """returns deterministic pseudo-audio bytes for a media path"""
+    seed = hashlib.sha256(path.encode('utf-8')).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def make_image(path, size=256):
+    """returns a solid colour PNG, colour derived from path"""
+    r, g, b = hashlib.sha256(path.encode('utf-8')).digest()[:3]
+    row = b'\x00' + bytes((r, g, b)) * size
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size)) + chunk(b'IEND', b''))
+
+
+def write_opml(filename, feeds, port):
+    """writes an OPML file listing every mock feed"""
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<opml version="1.0">\n  <body>\n')
+        # the parsers skip the first xmlUrl line, as in a PodcastAddict export
+        f.write(f'    <outline text="header" type="rss" xmlUrl="http://127.0.0.1:{port}/feed/header.xml" />\n')
+        for i in range(feeds):
+            f.write(f'    <outline text="Mock feed {i}" type="rss" '
+                    f'xmlUrl="http://127.0.0.1:{port}/feed/{i}.xml" htmlUrl="" '
+                    f'imageUrl="http://127.0.0.1:{port}/art/{i}.png" />\n')
+        f.write('  </body>\n</opml>\n')
+
+
+class MockFeedHandler(BaseHTTPRequestHandler):
+    """serves /feed/<n>.xml, /media/... and /art/<n>.png, every HUB_EVERY-th feed
+    advertises /hub, a stand-in WebSub hub, and POST /publish/<n> adds an
+    episode to feed n and pushes it to the hub's subscribers"""
+    delay = 0.0
+    episodes = {}
+    subscribers = {}
+
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def feed_body(self, feed_index):
+        episodes = self.episodes.get(feed_index, EPISODES_PER_FEED)
+        hub = feed_index.isdigit() and int(feed_index) % HUB_EVERY == 0
+        return make_feed(feed_index, episodes, self.base_url(), hub).encode('utf-8')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path == '/hub':
+            form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+            self.send_response(202)
+            self.end_headers()
+            threading.Thread(target=self.verify_intent, args=(form,), daemon=True).start()
+        elif self.path.startswith('/publish/'):
+            feed_index = self.path[len('/publish/'):]
+            self.episodes[feed_index] = self.episodes.get(feed_index, EPISODES_PER_FEED) + 1
+            self.send_response(204)
+            self.end_headers()
+            topic = f"{self.base_url()}/feed/{feed_index}.xml"
+            content = self.feed_body(feed_index)
+            for callback, secret in list(self.subscribers.get(topic, {}).items()):
+                headers = {'Content-Type': 'application/rss+xml'}
+                if secret:
+                    digest = hmac.new(secret.encode('utf-8'), content, hashlib.sha256).hexdigest()
+                    headers['X-Hub-Signature'] = f"sha256={digest}"
+                urllib.request.urlopen(urllib.request.Request(callback, data=content, headers=headers)).read()
+        else:
+            self.send_error(404)
+
+    def verify_intent(self, form):
+        """asynchronous verification of intent, as a real hub would do"""
+        challenge = secrets.token_hex(8)
+        query = urlencode({'hub.mode': form['hub.mode'], 'hub.topic': form['hub.topic'],
+                           'hub.challenge': challenge, 'hub.lease_seconds': form.get('hub.lease_seconds', 3600)})
+        separator = '&' if '?' in form['hub.callback'] else '?'
+        try:
+            with urllib.request.urlopen(form['hub.callback'] + separator + query) as response:
+                confirmed = response.status == 200 and response.read().decode('utf-8') == challenge
+        except OSError:
+            confirmed = False
+        if confirmed:
+            topic_subscribers = self.subscribers.setdefault(form['hub.topic'], {})
+            if form['hub.mode'] == 'subscribe':
+                topic_subscribers[form['hub.callback']] = form.get('hub.secret')
+            else:
+                topic_subscribers.pop(form['hub.callback'], None)
+
+    def do_GET(self):
+        if self.path.startswith('/media/'):
+            self.send_media()
+            return
+        if self.path.startswith('/art/'):
+            self.send_image()
+            return
+        if not self.path.startswith('/feed/'):
+            self.send_error(404)
+            return
+        time.sleep(self.delay)
+        feed_index = self.path[len('/feed/'):].split('.')[0]
+        body = self.feed_body(feed_index)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_media(self):
+        """serves MEDIA_SIZE deterministic bytes per episode, honouring a
+        single Range header"""
+        body = make_media(self.path)
+        start, end = 0, len(body) - 1
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[len('bytes='):].partition('-')
+            start = int(first)
+            end = min(int(last), end) if last else end
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(body[start:end + 1])
+
+    def send_image(self):
+        """serves make_image with an ETag, answering If-None-Match with 304"""
+        body = make_image(self.path)
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8000, delay=0.0):
+    MockFeedHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockFeedHandler)
+    print(f"Serving mock feeds on http://127.0.0.1:{server.server_port}/feed/<n>.xml")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3:
+        feeds = int(sys.argv[1])
+        port = int(sys.argv[2])
+        write_opml('mock_feeds.opml', feeds, port)
+        print(f"Wrote mock_feeds.opml with {feeds} feeds")
+        delay = float(sys.argv[3]) if len(sys.argv) >= 4 else 0.0
+        serve(port, delay)
+    else:
+        print('mandatory arguments [number of feeds] [port], optional [delay seconds]')
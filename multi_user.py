@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# Fetch the feeds of several users' OPML exports once, fan results out per user
+import asyncio
+import multiprocessing
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from extraction_memo import ExtractionMemo
+from memory_usage_optimized_2 import parse_opml_file, stream_process_feeds, find_newest_url, EXTRACTOR_VERSION
+
+
+def merge_subscriptions(opml_filenames):
+    """returns (unique feed_info, dict of feed url -> list of user indexes)"""
+    feed_info = []
+    subscribers = defaultdict(list)
+    for user, opml_filename in enumerate(opml_filenames):
+        for name, url in parse_opml_file(opml_filename):
+            if url not in subscribers:
+                feed_info.append((name, url))
+            if user not in subscribers[url]:
+                subscribers[url].append(user)
+    return feed_info, subscribers
+
+
+class UserOutputs:
+    """a user's <opml>.txt with all episodes and <opml>_newest.txt with
+    the newest episode of each feed, written as feeds complete"""
+
+    def __init__(self, opml_filename):
+        file_path = Path(opml_filename)
+        self.txt_path = file_path.with_suffix('.txt')
+        self.newest_path = file_path.parent / f"{file_path.stem}_newest.txt"
+        self.txt_file = open(self.txt_path, 'w')
+        self.newest_file = open(self.newest_path, 'w')
+
+    def write(self, result):
+        for media_url in result['media_urls']:
+            self.txt_file.write(f"{media_url}\n")
+        newest = find_newest_url(result['content'])
+        if newest:
+            self.newest_file.write(f"{newest}\n")
+
+    def close(self):
+        self.txt_file.close()
+        self.newest_file.close()
+
+
+async def main_async(opml_filenames, max_concurrent_requests=20, http2=False):
+    feed_info, subscribers = merge_subscriptions(opml_filenames)
+    subscriptions = sum(len(users) for users in subscribers.values())
+    print(f"Found {subscriptions} subscriptions to {len(feed_info)} distinct feeds in {len(opml_filenames)} OPML files")
+
+    outputs = [UserOutputs(opml_filename) for opml_filename in opml_filenames]
+    memo = ExtractionMemo(Path(opml_filenames[0]).parent / 'multi_user_memo.sqlite', EXTRACTOR_VERSION)
+    process_pool_size = max(1, multiprocessing.cpu_count() - 1)
+    start_time = time.time()
+    failed = 0
+    async for result in stream_process_feeds(feed_info, max_concurrent_requests, process_pool_size,
+                                             http2=http2, memo=memo):
+        if not result['success']:
+            failed += 1
+            continue
+        for user in subscribers[result['url']]:
+            outputs[user].write(result)
+        result['content'] = None
+    memo.close()
+    for output in outputs:
+        output.close()
+
+    print(f"\nSummary: Fetched {len(feed_info)} distinct feeds ({failed} failed) "
+          f"for {subscriptions} subscriptions")
+    print(f"Total processing time: {time.time() - start_time:.2f} seconds")
+    print(f"Extraction memo: {memo.hits} hits, {memo.misses} misses")
+    for output in outputs:
+        print(f"Media URLs saved to: {output.txt_path}, newest to: {output.newest_path}")
+
+
+def main(opml_filenames, max_concurrent_requests=20, http2=False):
+    asyncio.run(main_async(opml_filenames, max_concurrent_requests, http2))
+
+
+if __name__ == '__main__':
+    http2 = '--http2' in sys.argv
+    if http2:
+        sys.argv.remove('--http2')
+    max_concurrent = 20
+    if len(sys.argv) >= 2 and sys.argv[1].isdigit():
+        max_concurrent = int(sys.argv.pop(1))
+    if len(sys.argv) < 2:
+        print("Usage: python multi_user.py [max_concurrent_requests] <opml_file> [<opml_file> ...] [--http2]")
+        sys.exit(1)
+    main(sys.argv[1:], max_concurrent, http2)
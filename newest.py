@@ -28,9 +28,36 @@ def extract_media_urls(json_file):
 
     return media_urls
 
+def stream_newest_urls(lines):
+    """
+    Yield the newest episode URL of each feed from a JSONL record stream
+    (memory_usage_optimized_2.py --jsonl) as soon as its feed record arrives.
+    A feed seen twice, as when a retried shard replays its records, is
+    only yielded the first time.
+
+    Args:
+        lines (iterable): Lines of JSONL, e.g. sys.stdin or a FIFO
+
+    Yields:
+        str: Newest media URL per feed
+    """
+    seen = set()
+    for line in lines:
+        record = json.loads(line)
+        if record['type'] == 'feed' and record['newest'] and record['name'] not in seen:
+            seen.add(record['name'])
+            yield record['newest']
+
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == '--jsonl':
+        source = sys.stdin if len(sys.argv) < 3 or sys.argv[2] == '-' else open(sys.argv[2])
+        for url in stream_newest_urls(source):
+            print(url, flush=True)
+        sys.exit(0)
+
     if len(sys.argv) < 2:
         print("Usage: python script.py <json_file>")
+        print("       python script.py --jsonl [jsonl_file or -]")
         sys.exit(1)
 
     # Extract and print the media URLs
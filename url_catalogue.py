@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# Compact front-coded URL catalogue for powercasts output files
+import mmap
+import random
+import struct
+import sys
+
+MAGIC = b'PCAT1\n'
+HEADER = struct.Struct('<6sIIIQ')   # magic, count, block size, block count, index offset
+OFFSET = struct.Struct('<Q')
+BLOCK_SIZE = 32
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf, pos):
+    shift = 0
+    value = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _shared_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def build_catalogue(urls, cat_path, block_size=BLOCK_SIZE):
+    """takes iterable of urls and filename, writes a sorted front-coded
+    catalogue with a block index, returns number of urls stored"""
+
+    keys = sorted({url.strip().encode('utf-8') for url in urls if url.strip()})
+    body = bytearray()
+    offsets = []
+    previous = b''
+    for i, key in enumerate(keys):
+        if i % block_size == 0:
+            # every block starts with a full key so it can be decoded alone
+            offsets.append(HEADER.size + len(body))
+            shared = 0
+        else:
+            shared = _shared_prefix(previous, key)
+        _write_varint(body, shared)
+        _write_varint(body, len(key) - shared)
+        body += key[shared:]
+        previous = key
+
+    index_offset = HEADER.size + len(body)
+    with open(cat_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys), block_size, len(offsets), index_offset))
+        f.write(body)
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+    return len(keys)
+
+
+class UrlCatalogue:
+    """read-only view of a catalogue file via mmap, supports len(),
+    ordinal indexing, membership tests, iteration and random sampling"""
+
+    def __init__(self, cat_path):
+        self._file = open(cat_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._block_size, self._blocks, index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{cat_path} is not a url catalogue")
+        self._index_offset = index_offset
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _block_offset(self, block):
+        return OFFSET.unpack_from(self._map, self._index_offset + block * OFFSET.size)[0]
+
+    def _decode_block(self, block):
+        """yield the keys of one block as bytes (internal)"""
+        pos = self._block_offset(block)
+        first = block * self._block_size
+        last = min(first + self._block_size, self._count)
+        key = b''
+        for _ in range(first, last):
+            shared, pos = _read_varint(self._map, pos)
+            length, pos = _read_varint(self._map, pos)
+            key = key[:shared] + self._map[pos:pos + length]
+            pos += length
+            yield key
+
+    def _first_key(self, block):
+        pos = self._block_offset(block)
+        _, pos = _read_varint(self._map, pos)
+        length, pos = _read_varint(self._map, pos)
+        return self._map[pos:pos + length]
+
+    def __getitem__(self, ordinal):
+        if ordinal < 0:
+            ordinal += self._count
+        if not 0 <= ordinal < self._count:
+            raise IndexError('catalogue index out of range')
+        block, skip = divmod(ordinal, self._block_size)
+        for i, key in enumerate(self._decode_block(block)):
+            if i == skip:
+                return key.decode('utf-8')
+
+    def index(self, url):
+        """return ordinal of url, binary searching block heads first"""
+        target = url.strip().encode('utf-8')
+        lo, hi = 0, self._blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_key(mid) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        block = lo - 1
+        if block >= 0:
+            for i, key in enumerate(self._decode_block(block)):
+                if key == target:
+                    return block * self._block_size + i
+                if key > target:
+                    break
+        raise ValueError(f"{url} is not in catalogue")
+
+    def __contains__(self, url):
+        try:
+            self.index(url)
+        except ValueError:
+            return False
+        return True
+
+    def __iter__(self):
+        for block in range(self._blocks):
+            for key in self._decode_block(block):
+                yield key.decode('utf-8')
+
+    def sample(self, k=1):
+        """return k distinct random urls"""
+        return [self[i] for i in random.sample(range(self._count), min(k, self._count))]
+
+    def export(self, out):
+        """stream every url as a line of plain text, e.g. for VLC"""
+        for url in self:
+            out.write(url)
+            out.write('\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'build':
+        with open(sys.argv[2], 'r') as f:
+            count = build_catalogue(f, sys.argv[3])
+        print(f"Wrote {count} urls to {sys.argv[3]}")
+    elif len(sys.argv) == 4 and sys.argv[1] == 'export':
+        with UrlCatalogue(sys.argv[2]) as catalogue, open(sys.argv[3], 'w') as out:
+            catalogue.export(out)
+    elif len(sys.argv) in (3, 4) and sys.argv[1] == 'sample':
+        count = int(sys.argv[3]) if len(sys.argv) == 4 else 1
+        with UrlCatalogue(sys.argv[2]) as catalogue:
+            for url in catalogue.sample(count):
+                print(url)
+    else:
+        print('usage: url_catalogue.py build [urls.txt] [catalogue.cat]')
+        print('       url_catalogue.py export [catalogue.cat] [urls.txt]')
+        print('       url_catalogue.py sample [catalogue.cat] [count]')
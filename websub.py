@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# WebSub push mode: subscribe to feed hubs, poll only feeds without one
+import asyncio
+import hmac
+import os
+import secrets
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from memory_usage_optimized_2 import (parse_opml_file, stream_process_feeds, extract_media_urls,
+                                      MEDIA_URL_PATTERN)
+from memory_budget import body_encoding
+
+LEASE_SECONDS = 24 * 3600
+POLL_INTERVAL = 30 * 60
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+
+
+class Subscription:
+    def __init__(self, name, url, hub, topic):
+        self.name = name
+        self.url = url
+        self.hub = hub
+        self.topic = topic or url
+        self.secret = secrets.token_hex(16)
+        self.token = secrets.token_urlsafe(12)
+        self.expires = 0.0
+
+    @property
+    def active(self):
+        return self.expires > time.time()
+
+
+class EpisodeOutputs:
+    """incrementally maintained .txt of all episodes and newest.txt, one
+    newest episode per feed as newest.py would pick it"""
+
+    def __init__(self, txt_path, newest_path):
+        self.txt_path = Path(txt_path)
+        self.newest_path = Path(newest_path)
+        self.known = set()
+        self.newest = {}
+        self.txt_path.write_text('')
+
+    def apply(self, name, content, media_urls=None):
+        """add episodes from one feed body, returns number of new urls,
+        media_urls saves the scan when they were extracted already"""
+        if media_urls is None:
+            media_urls = extract_media_urls(content)
+        new_urls = media_urls - self.known
+        if new_urls:
+            self.known |= new_urls
+            with open(self.txt_path, 'a') as output_file:
+                for media_url in new_urls:
+                    output_file.write(f"{media_url}\n")
+        match = MEDIA_URL_PATTERN.search(content)
+        if match and self.newest.get(name) != match.group(1):
+            self.newest[name] = match.group(1)
+            self.write_newest()
+        return len(new_urls)
+
+    def write_newest(self):
+        tmp = self.newest_path.with_name(self.newest_path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            for media_url in self.newest.values():
+                f.write(f"{media_url}\n")
+        os.replace(tmp, self.newest_path)
+
+
+class PushReceiver:
+    """WebSub subscriber, serves the callback endpoint and keeps feeds
+    without a live subscription on a polling schedule"""
+
+    def __init__(self, feed_info, outputs, callback_base, max_concurrent_requests=20):
+        self.feed_info = feed_info
+        self.outputs = outputs
+        self.callback_base = callback_base.rstrip('/')
+        self.max_concurrent_requests = max_concurrent_requests
+        self.subscriptions = {}
+
+    async def poll(self, feed_info):
+        # subscriptions are keyed by callback token, one per feed name
+        subscribed = {s.name for s in self.subscriptions.values()}
+        async for result in stream_process_feeds(feed_info, self.max_concurrent_requests, 0,
+                                                 desc="Polling feeds"):
+            if not result['success']:
+                continue
+            self.outputs.apply(result['name'], result['content'], result['media_urls'])
+            if result['hub'] and result['name'] not in subscribed:
+                subscribed.add(result['name'])
+                hub, topic = result['hub']
+                subscription = Subscription(result['name'], result['url'], hub, topic)
+                self.subscriptions[subscription.token] = subscription
+
+    async def subscribe(self, session, subscription, mode='subscribe'):
+        form = {
+            'hub.mode': mode,
+            'hub.topic': subscription.topic,
+            'hub.callback': f"{self.callback_base}/websub/{subscription.token}",
+            'hub.secret': subscription.secret,
+            'hub.lease_seconds': str(LEASE_SECONDS),
+        }
+        try:
+            async with session.post(subscription.hub, data=form, headers={'User-Agent': USER_AGENT}) as response:
+                if response.status not in (202, 204):
+                    print(f"Hub refused {subscription.name}: HTTP {response.status}")
+        except Exception as e:
+            print(f"Subscribing {subscription.name} failed: {e}")
+
+    async def verify(self, request):
+        """hub verification of intent, echo the challenge for known topics"""
+        subscription = self.subscriptions.get(request.match_info['token'])
+        query = request.query
+        if not subscription or query.get('hub.topic') != subscription.topic:
+            raise web.HTTPNotFound()
+        if query.get('hub.mode') == 'subscribe':
+            lease = int(query.get('hub.lease_seconds', LEASE_SECONDS))
+            subscription.expires = time.time() + lease
+        elif query.get('hub.mode') == 'unsubscribe':
+            subscription.expires = 0.0
+        else:
+            raise web.HTTPNotFound()
+        return web.Response(text=query.get('hub.challenge', ''))
+
+    async def receive(self, request):
+        """content distribution, apply the pushed feed body to the outputs"""
+        subscription = self.subscriptions.get(request.match_info['token'])
+        if not subscription:
+            raise web.HTTPNotFound()
+        body = await request.read()
+        method, _, signature = request.headers.get('X-Hub-Signature', '').partition('=')
+        if method not in ('sha1', 'sha256', 'sha384', 'sha512'):
+            return web.Response(status=202)
+        expected = hmac.new(subscription.secret.encode('utf-8'), body, method).hexdigest()
+        # per the spec a bad signature is acknowledged but the content ignored
+        if hmac.compare_digest(expected, signature):
+            added = self.outputs.apply(subscription.name, body.decode(body_encoding(request.charset), 'replace'))
+            print(f"Push from {subscription.name}: {added} new episodes")
+        return web.Response(status=202)
+
+    async def run(self, port, poll_interval=POLL_INTERVAL):
+        app = web.Application()
+        app.router.add_get('/websub/{token}', self.verify)
+        app.router.add_post('/websub/{token}', self.receive)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+        try:
+            await self.poll(self.feed_info)
+            async with aiohttp.ClientSession() as session:
+                while True:
+                    renew = [s for s in self.subscriptions.values()
+                             if s.expires < time.time() + poll_interval]
+                    await asyncio.gather(*[self.subscribe(session, s) for s in renew])
+                    await asyncio.sleep(poll_interval)
+                    # only feeds without a verified, unexpired subscription are polled
+                    pushed = {s.name for s in self.subscriptions.values() if s.active}
+                    polled = [(name, url) for name, url in self.feed_info if name not in pushed]
+                    print(f"{len(self.subscriptions)} feeds with a hub, {len(pushed)} pushed, "
+                          f"{len(polled)} polled")
+                    await self.poll(polled)
+        finally:
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(*[self.subscribe(session, s, 'unsubscribe')
+                                       for s in self.subscriptions.values() if s.active])
+            await runner.cleanup()
+
+
+def main(opml_filename, callback_base, port, poll_interval=POLL_INTERVAL):
+    file_path = Path(opml_filename)
+    feed_info = parse_opml_file(file_path)
+    print(f"Found {len(feed_info)} feeds in {opml_filename}")
+    outputs = EpisodeOutputs(file_path.with_suffix('.txt'), file_path.parent / 'newest.txt')
+    receiver = PushReceiver(feed_info, outputs, callback_base)
+    try:
+        asyncio.run(receiver.run(port, poll_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print("Usage: python websub.py <opml_file> <public_callback_base_url> <port> [poll_interval_seconds]")
+        sys.exit(1)
+    poll_interval = POLL_INTERVAL
+    if len(sys.argv) >= 5:
+        try:
+            poll_interval = int(sys.argv[4])
+        except ValueError:
+            print(f"Invalid value for poll_interval_seconds: {sys.argv[4]}. Using default: {POLL_INTERVAL}")
+    main(sys.argv[1], sys.argv[2], int(sys.argv[3]), poll_interval)